@@ -7,47 +7,134 @@ This is the main executable module. Currently, the only command line parameter
 is the path to a config file, defaulting to config.json in the current
 directory.
 
-It shows an example on how the amolyst classes can be used in combination.
+It shows an example on how the amolyst classes can be used in combination. If the
+config sets ``streaming`` to true, collected entries are written to CSV files directly
+instead of being processed in memory.
 """
 
+import os
+import pickle
 import sys
-import json
+import tempfile
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .base import MySQLCollector, close_pools, json_loads
 from .state import CollectorMemoryState, ProcessorMemoryState
 
 from .processors import ALL_PROCESSORS
 from .collectors import ALL_COLLECTORS
 
-from .formatters import CSVFormatter
+from .formatters import CSVFormatter, StreamingCSVPipeline
 
 
 def loadconfig(configname):
     """
-    Loads the JSON config file with the given path
+    Loads the JSON config file with the given path. The parsed config is cached in a
+    pickle file next to it, which is used as long as the modification time and size of the
+    config file are unchanged. As loading a pickle can run arbitrary code, the directory
+    containing the config file must only be writable by trusted users.
 
     Args:
         configname (string):
             The filename to load
     """
+    stat = os.stat(configname)
+    fingerprint = (stat.st_mtime_ns, stat.st_size)
+    cachename = configname + '.pkl'
+
+    try:
+        with open(cachename, 'rb') as cachefile:
+            cached_fingerprint, config = pickle.load(cachefile)
+        if cached_fingerprint == fingerprint:
+            return config
+    except Exception:  # pylint: disable=broad-except
+        # The cache is optional, missing or corrupt caches are parsed again
+        pass
+
+    with open(configname, 'rb') as cfg:
+        config = json_loads(cfg.read())
+
+    tmpname = None
+    try:
+        cachedir = os.path.dirname(os.path.abspath(cachename))
+        with tempfile.NamedTemporaryFile(dir=cachedir, delete=False) as tmpfile:
+            tmpname = tmpfile.name
+            pickle.dump((fingerprint, config), tmpfile, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpname, cachename)
+    except OSError:
+        # The cache is optional, e.g. when the config directory is read-only
+        if tmpname is not None:
+            try:
+                os.unlink(tmpname)
+            except OSError:
+                pass
+
+    return config
+
+
+def stream(config):
+    """
+    Collect all entries into a streaming pipeline, writing them out while they are being
+    collected.
+
+    Args:
+        config (dict):
+            The configuration data to use
+    """
+    pipeline = StreamingCSVPipeline(config)
+    for processor_class in ALL_PROCESSORS:
+        processor_class.register(pipeline)
 
-    with open(configname, 'r') as cfg:
-        return json.load(cfg)
+    try:
+        collect(pipeline, config)
+    finally:
+        pipeline.close()
 
 
-def main():
+def collect(state, config):
     """
-    The main function for this module.
+    Run all collectors concurrently. The collectors read from independent sources, so
+    waiting for the database and reading files can overlap. Database collectors run one
+    after another in the same thread, so they can share a pooled connection.
+
+    Args:
+        state (amolyst.state.CollectorState):
+            The state to collect into
+        config (dict):
+            The configuration data to use
     """
-    config = loadconfig(sys.argv[1] if len(sys.argv) > 1 else 'config.json')
+    database = [cls for cls in ALL_COLLECTORS if issubclass(cls, MySQLCollector)]
+    groups = [[cls] for cls in ALL_COLLECTORS if not issubclass(cls, MySQLCollector)]
+    if database:
+        groups.append(database)
+
+    with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+        # Consume the results so that errors are raised
+        list(executor.map(partial(_read_collectors, state, config), groups))
+
+
+def _read_collectors(state, config, collector_classes):
+    for collector_class in collector_classes:
+        collector = collector_class(state, config)
+        collector.read()
 
+
+def process(config):
+    """
+    Collect all entries into memory, process them and write the result to CSV files.
+
+    Args:
+        config (dict):
+            The configuration data to use
+    """
     # for each collector
     cstate = CollectorMemoryState()
-    for collector_class in ALL_COLLECTORS:
-        collector = collector_class(cstate, config)
-        collector.read()
+    collect(cstate, config)
 
-    print "Collector State:"
-    print cstate
+    print("Collector State:")
+    print(cstate)
 
     # for each processor
     pstate = ProcessorMemoryState()
@@ -55,13 +142,28 @@ def main():
         processor = processor_class(cstate, pstate, config)
         processor.process()
 
-    print "\n\nProcessor State:"
-    print pstate
+    print("\n\nProcessor State:")
+    print(pstate)
 
     # format
     formatter = CSVFormatter(pstate, config)
     formatter.write()
 
 
+def main():
+    """
+    The main function for this module.
+    """
+    config = loadconfig(sys.argv[1] if len(sys.argv) > 1 else 'config.json')
+
+    try:
+        if config.get('streaming', False):
+            stream(config)
+        else:
+            process(config)
+    finally:
+        close_pools()
+
+
 if __name__ == "__main__":
     main()
@@ -8,11 +8,35 @@ This file should be split up once it has more subclasses
 """
 
 import os
+import sys
 
-import fnmatch
+import hashlib
 import json
+import pickle
+import tempfile
 import MySQLdb
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
+from multiprocessing import get_context
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    try:
+        from ujson import loads as json_loads
+    except ImportError:
+        from json import loads as json_loads
+
+# Idle MySQL connections, keyed by their connection parameters
+_POOLS = {}
+
+# The maximum number of idle connections kept for each set of connection parameters
+_POOL_SIZE = 8
+
 
 class Formatter(object):
     """
@@ -47,8 +71,10 @@ class Formatter(object):
 class Collector(object):
     """
     The base class for an amolyst collector. Allows connecting an external source to
-    amolyst, for use in the processor. Collectors should collect all possible data and not
-    filter out anything, as the filtering step is meant for the Processor.
+    amolyst, for use in the processor. Collectors should not filter out entries, as the
+    filtering step is meant for the Processor. They may however limit the data of each entry
+    to the fields the processors use, where the source makes that cheap, e.g. by selecting
+    only those columns from a database.
 
     Args:
         state (amolyst.state.CollectorState):
@@ -124,8 +150,16 @@ class JSONCollector(Collector):
     A :py:class:`Collector<amolyst.base.Collector>` sub-class that reads from JSON files.
     Implementations can overwrite the :py:meth:`read<amolyst.base.JSONCollector.read>`
     method to determine the base path for the JSON files, then call
-    :py:meth:`read_json<amolyst.base.JSONCollector.read_json>` to start processing.
+    :py:meth:`read_json<amolyst.base.JSONCollector.read_json>` or
+    :py:meth:`read_json_async<amolyst.base.JSONCollector.read_json_async>` to start
+    processing.
+
+    Attributes:
+        MAX_READS (int):
+            The maximum number of files being read or waiting to be collected at the same
+            time in :py:meth:`read_json_async<amolyst.base.JSONCollector.read_json_async>`
     """
+    MAX_READS = 256
 
     def read(self):
         """
@@ -139,21 +173,146 @@ class JSONCollector(Collector):
 
         self.read_json(path)
 
-    def read_json(self, basedir):
+    def read_json(self, basedir, cachedir=None):
         """
         Read JSON files from the base directory and use
         :py:meth:`collect_entry<amolyst.base.Collector.collect_entry>` to process each
-        file.
+        file. The files are parsed in a pool of worker processes, entries are collected
+        in the calling process.
+
+        Args:
+            basedir (string):
+                The base directory to read JSON files from
+            cachedir (Optional[string]):
+                A directory to cache parsed entries in. Cached entries are reused as long
+                as the modification time and size of the JSON file are unchanged. Entries
+                of files that no longer exist in the base directory are removed.
+        """
+        paths = list(_scan_json(basedir))
+        if cachedir is not None:
+            cachedir = _prepare_cache(basedir, cachedir, paths)
+
+        if not paths:
+            return
+
+        # Collectors may run in threads, and forking a multi-threaded process can deadlock
+        loader = partial(_load_json, cachedir=cachedir)
+        with get_context("spawn").Pool() as pool:
+            for entry in pool.imap(loader, paths, chunksize=64):
+                self.collect_entry(entry)
+
+    def read_json_async(self, basedir, cachedir=None):
+        """
+        Like :py:meth:`read_json<amolyst.base.JSONCollector.read_json>`, but for directories
+        with many small files, where reading is bound by file system latency rather than
+        parsing. Instead of a pool of worker processes, many files are read concurrently,
+        while entries are still collected in directory order.
 
         Args:
             basedir (string):
                 The base directory to read JSON files from
+            cachedir (Optional[string]):
+                A directory to cache parsed entries in, see
+                :py:meth:`read_json<amolyst.base.JSONCollector.read_json>`
         """
-        for root, _, files in os.walk(basedir):
-            for item in fnmatch.filter(files, "*.json"):
-                with open(os.path.join(root, item)) as jsonfile:
-                    entry = json.load(jsonfile)
-                    self.collect_entry(entry)
+        paths = list(_scan_json(basedir))
+        if cachedir is not None:
+            cachedir = _prepare_cache(basedir, cachedir, paths)
+
+        loader = partial(_load_json, cachedir=cachedir)
+        paths = iter(paths)
+        with ThreadPoolExecutor(max_workers=self.MAX_READS) as executor:
+            window = deque(executor.submit(loader, path) for path in islice(paths, self.MAX_READS))
+            while window:
+                entry = window.popleft().result()
+
+                path = next(paths, None)
+                if path is not None:
+                    window.append(executor.submit(loader, path))
+
+                self.collect_entry(entry)
+
+
+def _scan_json(basedir):
+    """
+    Recursively yield the paths of all JSON files in the base directory. Like
+    :py:func:`os.walk`, a missing base directory yields nothing.
+    """
+    try:
+        entries = os.scandir(basedir)
+    except (FileNotFoundError, NotADirectoryError):
+        return
+
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _scan_json(entry.path)
+            elif entry.name.endswith(".json") and entry.is_file():
+                yield entry.path
+
+
+def _cache_name(path):
+    """Returns the name used for caching the given path"""
+    return hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+
+
+def _prepare_cache(basedir, cachedir, paths):
+    """
+    Create the cache directory for the JSON files in the base directory and remove cached
+    entries that do not belong to any of the paths. Each base directory gets its own
+    sub-directory, so collectors sharing a cache directory keep their entries.
+    """
+    cachedir = os.path.join(cachedir, _cache_name(basedir))
+    os.makedirs(cachedir, exist_ok=True)
+
+    keep = {_cache_name(path) + '.pickle' for path in paths}
+    for entry in os.scandir(cachedir):
+        if entry.name.endswith('.pickle') and entry.name not in keep:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+    return cachedir
+
+
+def _load_json(path, cachedir=None):
+    """Load the JSON file at the given path, used by the worker processes"""
+    if cachedir is None:
+        with open(path, 'rb') as jsonfile:
+            return json_loads(jsonfile.read())
+
+    stat = os.stat(path)
+    fingerprint = (stat.st_mtime_ns, stat.st_size)
+    cachepath = os.path.join(cachedir, _cache_name(path) + '.pickle')
+
+    try:
+        with open(cachepath, 'rb') as cachefile:
+            cached_fingerprint, entry = pickle.load(cachefile)
+        if cached_fingerprint == fingerprint:
+            return entry
+    except Exception:  # pylint: disable=broad-except
+        # The cache is optional, missing or corrupt entries are parsed again
+        pass
+
+    entry = _load_json(path)
+
+    # Write to a temporary file first, so concurrent readers never see a partial entry
+    tmpname = None
+    try:
+        with tempfile.NamedTemporaryFile(dir=cachedir, delete=False) as tmpfile:
+            tmpname = tmpfile.name
+            pickle.dump((fingerprint, entry), tmpfile, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpname, cachepath)
+    except OSError:
+        # The cache is optional, e.g. when the cache directory is read-only or full
+        if tmpname is not None:
+            try:
+                os.unlink(tmpname)
+            except OSError:
+                pass
+
+    return entry
 
 
 class MySQLCollector(Collector):
@@ -181,19 +340,63 @@ class MySQLCollector(Collector):
     def read_sql(self, **kwargs):
         """
         Read entries from the database and process each one with
-        :py:meth:`collect_entry<amolyst.base.Collector.collect_entry>`.
+        :py:meth:`collect_entry<amolyst.base.Collector.collect_entry>`. Rows are streamed
+        from the server as they are processed instead of being fetched all at once.
 
         Args:
             **kwargs: Parameters passed directly to :py:meth:`MySQLdb.connect`.
         """
-        conn = MySQLdb.connect(**kwargs)
+        with pooled_connection(**kwargs) as conn:
+            cursor = conn.cursor(MySQLdb.cursors.SSCursor)
+            print(self)
+            try:
+                cursor.execute(self.SQL_QUERY)
 
-        cursor = conn.cursor(MySQLdb.cursors.DictCursor)
-        print self
-        cursor.execute(self.SQL_QUERY)
+                columns = [description[0] for description in cursor.description]
+                for row in cursor:
+                    self.collect_entry(dict(zip(columns, row)))
+            finally:
+                cursor.close()
 
-        for entry in cursor.fetchall():
-            self.collect_entry(entry)
+
+@contextmanager
+def pooled_connection(**kwargs):
+    """
+    Retrieve a MySQL connection from the pool, creating one if there is no idle connection
+    for the given parameters. The connection is returned to the pool when the context is
+    left, so that subsequent collectors using the same database can reuse it. Connections
+    with parameters that cannot be serialized to JSON are not pooled.
+
+    Args:
+        **kwargs: Parameters passed directly to :py:meth:`MySQLdb.connect`.
+    """
+    try:
+        key = json.dumps(kwargs, sort_keys=True)
+    except (TypeError, ValueError):
+        # Parameters that cannot be serialized get a connection of their own
+        key = None
+
+    idle = _POOLS.setdefault(key, []) if key is not None else []
+    conn = idle.pop() if idle else MySQLdb.connect(**kwargs)
+    try:
+        yield conn
+    except Exception:
+        conn.close()
+        raise
+
+    if key is not None and len(idle) < _POOL_SIZE:
+        idle.append(conn)
+    else:
+        conn.close()
+
+
+def close_pools():
+    """
+    Close all idle MySQL connections in the pool. Call this once all collectors are done.
+    """
+    for idle in _POOLS.values():
+        while idle:
+            idle.pop().close()
 
 
 class Processor(object):
@@ -210,6 +413,10 @@ class Processor(object):
         config (dict):
             The configuration data to use while processing
     """
+
+    # Generated selector functions, keyed by category and fields
+    _SELECTORS = {}
+
     def __init__(self, collector_state, processor_state, config):
         self.cstate = collector_state
         self.pstate = processor_state
@@ -224,6 +431,21 @@ class Processor(object):
         """
         raise NotImplementedError()
 
+    @classmethod
+    def register(cls, pipeline):
+        """
+        This method should be overwritten by subclasses that support streaming, and
+        register a transform for each category with a pipeline like
+        :py:class:`StreamingCSVPipeline<amolyst.formatters.csv.StreamingCSVPipeline>`.
+        As entries are written while they are collected, transforms cannot combine data
+        from multiple categories.
+
+        Args:
+            pipeline (amolyst.formatters.csv.StreamingCSVPipeline):
+                The pipeline to register transforms with
+        """
+        raise NotImplementedError()
+
     def processfields(self, namespace, category, func):
         """
         Process all fields in the category using the passed function.
@@ -236,14 +458,19 @@ class Processor(object):
             func (function):
                 The function to call for each entry in the category
         """
-        for ident, entry in self.cstate.items(namespace, category):
-            fields = func(entry)
+        catkeys = {}
+
+        def prefixfields(entry):
+            """Returns the processed entry with the keys prefixed by the category"""
             fielddata = {}
-            for key, value in fields.iteritems():
-                catkey = "%s.%s" % (category, key)
+            for key, value in func(entry).items():
+                catkey = catkeys.get(key)
+                if catkey is None:
+                    catkey = catkeys[key] = sys.intern("%s.%s" % (category, key))
                 fielddata[catkey] = value
+            return fielddata
 
-            self.pstate.update(namespace, ident, fielddata)
+        self._updatefields(namespace, category, prefixfields)
 
     def selectfields(self, namespace, category, fields=None):
         """
@@ -257,15 +484,39 @@ class Processor(object):
             fields (Optional[list[string]]):
                 The fields to select. If not passed, all fields are selected
         """
-        def limitfields(entry):
-            """Returns a copy of the entry, limited to the fields"""
-            return {field: entry[field] for field in fields}
-
         def allfields(entry):
             """Returns the entry itself, to use all fields"""
             return entry
 
-        self.processfields(namespace, category, allfields if fields is None else limitfields)
+        if fields is None:
+            self.processfields(namespace, category, allfields)
+        else:
+            selector = self._compile_selector(category, fields)
+            self._updatefields(namespace, category, selector)
+
+    @classmethod
+    def _compile_selector(cls, category, fields):
+        """
+        Generate a function that returns a dict of the given fields in an entry, keyed by
+        the category-prefixed field name. The dict is built from a literal in the function
+        body, which is cheaper than a generic loop over the fields.
+        """
+        key = (category, tuple(fields))
+        selector = cls._SELECTORS.get(key)
+        if selector is None:
+            items = ", ".join(
+                "%r: entry[%r]" % ("%s.%s" % (category, field), field) for field in fields
+            )
+            source = "def selector(entry):\n    return {%s}\n" % items
+            scope = {}
+            exec(source, scope)  # pylint: disable=exec-used
+            selector = cls._SELECTORS[key] = scope['selector']
+        return selector
+
+    def _updatefields(self, namespace, category, func):
+        self.pstate.update_many(namespace, (
+            (ident, func(entry)) for ident, entry in self.cstate.items(namespace, category)
+        ))
 
     def relate(self, from_ns, to_ns):
         """
@@ -280,9 +531,7 @@ class Processor(object):
                 The namespace related to
         """
         namespace = from_ns + "--" + to_ns
-        for fromdata, todata in self.cstate.relationitems(namespace):
-            ident = "{}-{}".format(fromdata, todata)
-            self.pstate.update(namespace, ident, {
-                from_ns: fromdata,
-                to_ns: todata
-            })
+        self.pstate.update_many(namespace, (
+            ((fromdata, todata), {from_ns: fromdata, to_ns: todata})
+            for fromdata, todata in self.cstate.relationitems(namespace)
+        ))
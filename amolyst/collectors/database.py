@@ -22,16 +22,18 @@ class AMOCollector(MySQLCollector):
 
 class DatabaseAddonsCollector(AMOCollector):
     """
-    A collector for the ``addons`` table, collecting all possible information about addons
+    A collector for the ``addons`` table, collecting the information about addons that is
+    used by the processors
     """
 
     NAMESPACE = "amo.addon"
     CATEGORY = "basemeta"
 
     SQL_QUERY = """
-           SELECT translations.localized_string AS name,
-                  versions.version AS current_version,
-                  addons.*
+           SELECT addons.id,
+                  addons.guid,
+                  translations.localized_string AS name,
+                  versions.version AS current_version
              FROM addons
         LEFT JOIN translations
                ON (addons.name = translations.id
@@ -46,13 +48,17 @@ class DatabaseAddonsCollector(AMOCollector):
 
 class DatabaseUsersCollector(AMOCollector):
     """
-    A collector for the ``users`` table, collecting all possible information about users
+    A collector for the ``users`` table, collecting the information about users that is
+    used by the processors
     """
 
     NAMESPACE = "amo.user"
     CATEGORY = "basemeta"
 
-    SQL_QUERY = "SELECT * FROM users"
+    SQL_QUERY = """
+        SELECT id, display_name, email, is_verified, lang, location, region, username
+          FROM users
+    """
 
 
 class DatabaseJunctionCollector(AMOCollector):
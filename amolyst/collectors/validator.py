@@ -43,8 +43,9 @@ class ValidatorCollector(JSONCollector):
     CATEGORY = "validator"
 
     def read(self):
-        basedir = self.config['collectors']['ValidatorCollector']['basedir']
-        self.read_json(basedir)
+        config = self.config['collectors']['ValidatorCollector']
+        read_json = self.read_json_async if config.get('async', False) else self.read_json
+        read_json(config['basedir'], config.get('cachedir'))
 
     def collect_entry(self, entry):
         self.field(entry['metadata']['id'], entry)
@@ -6,8 +6,9 @@
 This package contains all the formatters currently defined
 """
 
-from .csv import CSVFormatter
+from .csv import CSVFormatter, StreamingCSVPipeline
 
 __all__ = [
-    "CSVFormatter"
+    "CSVFormatter",
+    "StreamingCSVPipeline"
 ]
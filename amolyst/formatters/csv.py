@@ -3,37 +3,140 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 """
-A formatter that writes to CSV files, one per namespace.
+A formatter that writes to CSV files, one per namespace, and a streaming variant that
+writes entries while they are collected.
 """
 
-from __future__ import absolute_import
-
 import os
 import csv
+import threading
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 
 from ..base import Formatter
+from ..state import CollectorState
 
 
 class CSVFormatter(Formatter):
     """
     A formatter that outputs all processed fields into CSV files. Each namespace gets its
-    separate CSV file.
+    separate CSV file, the files are written concurrently.
     """
     # pylint: disable=too-few-public-methods
 
     def write(self):
-        for namespace, data in self.state.items():
-            self._write_namespace_file(namespace, self.state.fieldnames(namespace), data)
+        namespaces = []
+        fieldnames = []
+        columns = []
+        for namespace, nscolumns in self.state.items():
+            namespaces.append(namespace)
+            fieldnames.append(self.state.fieldnames_sorted(namespace))
+            columns.append(nscolumns)
+
+        if not namespaces:
+            return
 
-    def _write_namespace_file(self, name, fieldnames, data):
+        with ThreadPoolExecutor(max_workers=min(8, len(namespaces))) as executor:
+            # Consume the results so that errors are raised
+            list(executor.map(self._write_namespace_file, namespaces, fieldnames, columns))
+
+    def _write_namespace_file(self, name, fieldnames, columns):
         basedir = self.config['formatters']['CSVFormatter']['basedir']
-        with open(os.path.join(basedir, name + '.csv'), 'w') as csvfile:
-            self._write_namespace_handle(csvfile, fieldnames, data)
+        with open(os.path.join(basedir, name + '.csv'), 'w', newline='') as csvfile:
+            self._write_namespace_handle(csvfile, fieldnames, columns)
 
     @staticmethod
-    def _write_namespace_handle(csvfile, fieldnames, data):
-        writer = csv.DictWriter(csvfile, fieldnames=sorted(fieldnames))
-        writer.writeheader()
+    def _write_namespace_handle(csvfile, fieldnames, columns):
+        writer = csv.writer(csvfile)
+        writer.writerow(fieldnames)
+        writer.writerows(zip(*[columns[field] for field in fieldnames]))
+
+
+def _tuplegetter(fieldnames):
+    """Returns a function that retrieves the given fields from an entry as a tuple"""
+    getter = itemgetter(*fieldnames)
+    if len(fieldnames) == 1:
+        return lambda entry: (getter(entry),)
+    return getter
+
+
+class StreamingCSVPipeline(CollectorState):
+    """
+    A collector state that writes entries to CSV files as they are collected, instead of
+    keeping them in memory for processing. Entries of each category registered using
+    :py:meth:`register<amolyst.formatters.csv.StreamingCSVPipeline.register>` are
+    transformed and written to ``<namespace>.<category>.csv``, with the entry identifier in
+    the first column. Relations are written to ``<namespace>.csv``, one row for each
+    relation collected. Unlike the
+    :py:class:`CollectorMemoryState<amolyst.state.CollectorMemoryState>`, which keeps
+    only the last relation for each left side, all of them are written. Entries of
+    categories that were not registered are dropped.
+
+    Since entries are never joined, the pipeline cannot be used to read back items. Entries
+    may be written from multiple threads.
+
+    Args:
+        config (dict):
+            The JSON configuration, using the base directory of the CSVFormatter
+    """
+
+    def __init__(self, config):
+        self.basedir = config['formatters']['CSVFormatter']['basedir']
+        self.transforms = {}
+        self.relations = {}
+        self.handles = []
+        self.locks = defaultdict(threading.Lock)
+
+    def register(self, namespace, category, fieldnames, func=None):
+        """
+        Register a transform for the entries in the given namespace and category. The
+        output file is created immediately.
+
+        Args:
+            namespace (string):
+                The namespace of the entries to transform
+            category (string):
+                The category of the entries to transform
+            fieldnames (list[string]):
+                The fields to write for each entry
+            func (Optional[function]):
+                The function to call for each entry, returning a dict with at least the
+                fields to write. If not passed, the fields are taken from the entry itself
+        """
+        fieldnames = sorted(fieldnames)
+        writer = csv.writer(self._open(namespace + "." + category))
+        writer.writerow([namespace] + fieldnames)
+        self.transforms[(namespace, category)] = (_tuplegetter(fieldnames), func, writer)
+
+    def field(self, namespace, category, ident, entry):
+        transform = self.transforms.get((namespace, category))
+        if transform is None:
+            return
+
+        getter, func, writer = transform
+        row = (ident,) + getter(entry if func is None else func(entry))
+        with self.locks[namespace]:
+            writer.writerow(row)
+
+    def relate(self, namespace, category, fromid, toid):
+        with self.locks[namespace]:
+            writer = self.relations.get(namespace)
+            if writer is None:
+                writer = self.relations[namespace] = csv.writer(self._open(namespace))
+                writer.writerow(namespace.split("--"))
+
+            writer.writerow((fromid, toid))
+
+    def close(self):
+        """
+        Close all files written by this pipeline.
+        """
+        for handle in self.handles:
+            handle.close()
 
-        for _, entry in data.iteritems():
-            writer.writerow(entry)
+    def _open(self, name):
+        handle = open(os.path.join(self.basedir, name + '.csv'), 'w', newline='')
+        self.handles.append(handle)
+        return handle
@@ -14,29 +14,39 @@ class AMOProcessor(Processor):
     A processor that filters and selects data related to AMO addons and users
     """
 
-    def process(self):
-        def validator(entry):
-            """Processes the validator category"""
-            libs = set([
-                warning['detail']
-                for warning in entry['warnings']
-                if warning['code'] == "FOUND_REQUIRE"
-            ])
-
-            return {
-                "errors": entry['summary']['errors'],
-                "warnings": entry['summary']['warnings'],
-                "notices": entry['summary']['notices'],
-                "requires": ";".join(libs)
-            }
-
-        self.processfields('amo.addon', 'validator', validator)
-
-        self.selectfields('amo.addon', 'basemeta',
-                          ['id', 'guid', 'name', 'current_version'])
-
-        self.selectfields('amo.user', 'basemeta',
-                          ['display_name', 'email', 'is_verified', 'lang',
-                           'location', 'region', 'username'])
+    VALIDATOR_FIELDS = ['errors', 'warnings', 'notices', 'requires']
+
+    # These must be selected in the SQL queries of DatabaseAddonsCollector and
+    # DatabaseUsersCollector, which only read the columns used here
+    ADDON_FIELDS = ['id', 'guid', 'name', 'current_version']
+    USER_FIELDS = ['display_name', 'email', 'is_verified', 'lang',
+                   'location', 'region', 'username']
+
+    @staticmethod
+    def validator(entry):
+        """Processes the validator category"""
+        libs = dict.fromkeys(
+            warning['detail']
+            for warning in entry['warnings']
+            if warning['code'] == "FOUND_REQUIRE"
+        )
+        summary = entry['summary']
+
+        return {
+            "errors": summary['errors'],
+            "warnings": summary['warnings'],
+            "notices": summary['notices'],
+            "requires": ";".join(libs)
+        }
 
+    def process(self):
+        self.processfields('amo.addon', 'validator', self.validator)
+        self.selectfields('amo.addon', 'basemeta', self.ADDON_FIELDS)
+        self.selectfields('amo.user', 'basemeta', self.USER_FIELDS)
         self.relate("amo.addon", "amo.user")
+
+    @classmethod
+    def register(cls, pipeline):
+        pipeline.register('amo.addon', 'validator', cls.VALIDATOR_FIELDS, cls.validator)
+        pipeline.register('amo.addon', 'basemeta', cls.ADDON_FIELDS)
+        pipeline.register('amo.user', 'basemeta', cls.USER_FIELDS)
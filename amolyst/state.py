@@ -6,6 +6,8 @@
 This file contains classes related to the collector state and processor state
 """
 
+import threading
+
 from collections import defaultdict
 from functools import partial
 from pprint import pformat
@@ -26,13 +28,27 @@ class ProcessorState(object):
         Args:
             namespace (string):
                 The namespace entries should be updated in
-            ident (string):
-                The identifier for the processor entry
+            ident (hashable):
+                The identifier for the processor entry, e.g. a string or a tuple
             value (dict):
                 The values to merge in
         """
         raise NotImplementedError()
 
+    def update_many(self, namespace, items):
+        """
+        Update multiple entries in the given processor namespace. The default implementation
+        calls :py:meth:`update<amolyst.state.ProcessorState.update>` for each entry.
+
+        Args:
+            namespace (string):
+                The namespace entries should be updated in
+            items (iterable[tuple[hashable, dict]]):
+                Pairs of processor entry identifier and values to merge in
+        """
+        for ident, value in items:
+            self.update(namespace, ident, value)
+
     def fieldnames(self, namespace):
         """
         Retrieve the field names for the given namespace
@@ -43,47 +59,95 @@ class ProcessorState(object):
         """
         raise NotImplementedError()
 
+    def fieldnames_sorted(self, namespace):
+        """
+        Retrieve the field names for the given namespace as a sorted tuple.
+
+        Args:
+            namespace (string):
+                The namespace entries should be retrieved from
+        """
+        return tuple(sorted(self.fieldnames(namespace)))
+
     def items(self):
         """
-        Retrieve all items in the processor state.
+        Retrieve all items in the processor state, as pairs of namespace and columns. The
+        columns are a dict mapping each field name to the list of its values, one value
+        per entry in the same order for all fields. Missing values are ``None``.
         """
         raise NotImplementedError()
 
 
 class ProcessorMemoryState(ProcessorState):
     """
-    A processor state implemented with a memory backend
+    A processor state implemented with a memory backend. Values are stored by column, each
+    namespace keeps a list of values per field and the row index of each entry.
     """
     def __init__(self):
-        self.outdata = defaultdict(partial(defaultdict, dict))
+        self.idents = defaultdict(list)
+        self.rows = defaultdict(dict)
+        self.columns = defaultdict(dict)
         self.fields = defaultdict(set)
+        self.sorted_fields = {}
 
     def update(self, namespace, ident, value):
-        self.outdata[namespace][ident].update(value)
-        self.fields[namespace].update(value.keys())
+        self.update_many(namespace, ((ident, value),))
+
+    def update_many(self, namespace, items):
+        nsidents = self.idents[namespace]
+        nsrows = self.rows[namespace]
+        nscolumns = self.columns[namespace]
+        nsfields = self.fields[namespace]
+        for ident, value in items:
+            row = nsrows.get(ident)
+            if row is None:
+                row = nsrows[ident] = len(nsidents)
+                nsidents.append(ident)
+
+            for field, fieldvalue in value.items():
+                column = nscolumns.get(field)
+                if column is None:
+                    column = nscolumns[field] = []
+                    nsfields.add(field)
+                    self.sorted_fields.pop(namespace, None)
+
+                missing = row - len(column)
+                if missing >= 0:
+                    column.extend([None] * missing)
+                    column.append(fieldvalue)
+                else:
+                    column[row] = fieldvalue
 
     def fieldnames(self, namespace):
         return self.fields[namespace]
 
+    def fieldnames_sorted(self, namespace):
+        fieldnames = self.sorted_fields.get(namespace)
+        if fieldnames is None:
+            fieldnames = self.sorted_fields[namespace] = tuple(sorted(self.fields[namespace]))
+        return fieldnames
+
     def items(self):
-        return self.outdata.iteritems()
+        for namespace, nscolumns in self.columns.items():
+            numrows = len(self.idents[namespace])
+            if not numrows:
+                continue
 
-    def _strentry(self, data):
+            for column in nscolumns.values():
+                column.extend([None] * (numrows - len(column)))
+            yield namespace, nscolumns
+
+    def __str__(self):
         strres = ""
-        for namespace, nsentry in data.iteritems():
+        for namespace, nscolumns in self.items():
             strres += "NAMESPACE {} ({})\n".format(namespace, ", ".join(self.fields[namespace]))
-            for idkey, itementry in nsentry.iteritems():
-                if isinstance(itementry, dict):
-                    fmtentry = pformat(itementry).replace("\n", "\n\t\t\t")
-                    strres += "\tENTRY({}):\n".format(idkey)
-                    strres += "\t\t{}\n".format(fmtentry)
-                else:
-                    strres += "\tENTRY({}) = {}\n".format(idkey, itementry)
+            for row, idkey in enumerate(self.idents[namespace]):
+                itementry = {field: column[row] for field, column in nscolumns.items()}
+                fmtentry = pformat(itementry).replace("\n", "\n\t\t\t")
+                strres += "\tENTRY({}):\n".format(idkey)
+                strres += "\t\t{}\n".format(fmtentry)
         return strres
 
-    def __str__(self):
-        return self._strentry(self.outdata)
-
 
 class CollectorState(object):
     """
@@ -152,33 +216,37 @@ class CollectorState(object):
 
 class CollectorMemoryState(CollectorState):
     """
-    A collector state implemented with a memory backend
+    A collector state implemented with a memory backend. Fields and relations may be
+    defined from multiple threads.
     """
 
     def __init__(self):
         self.data = defaultdict(partial(defaultdict, dict))
         self.relations = defaultdict(partial(defaultdict, dict))
+        self.locks = defaultdict(threading.Lock)
 
     def field(self, namespace, category, ident, entry):
-        self.data[namespace][category][ident] = entry
+        with self.locks[namespace]:
+            self.data[namespace][category][ident] = entry
 
     def relate(self, namespace, category, fromid, toid):
-        self.relations[namespace][category][fromid] = toid
+        with self.locks[namespace]:
+            self.relations[namespace][category][fromid] = toid
 
     def items(self, namespace, category):
-        return self.data[namespace][category].iteritems()
+        return self.data[namespace][category].items()
 
     def relationitems(self, namespace):
-        return self.relations[namespace][Collector.CATEGORY].iteritems()
+        return self.relations[namespace][Collector.CATEGORY].items()
 
     @staticmethod
     def _strentry(data):
         strres = ""
-        for namespace, nsentry in data.iteritems():
+        for namespace, nsentry in data.items():
             strres += "NAMESPACE {}\n".format(namespace)
-            for category, catentry in nsentry.iteritems():
+            for category, catentry in nsentry.items():
                 strres += "\tCATEGORY {}\n".format(category)
-                for idkey, itementry in catentry.iteritems():
+                for idkey, itementry in catentry.items():
                     if isinstance(itementry, dict):
                         fmtentry = pformat(itementry).replace("\n", "\n\t\t\t")
                         strres += "\t\tENTRY({}):\n".format(idkey)